@@ -1,18 +1,31 @@
+import shutil
 import subprocess
 
 # Select the Qwen3 model to download.
 model = "qwen3:4b"
 
+def is_model_downloaded(model_name: str) -> bool:
+    """
+    Checks whether Ollama already has the model locally, using `ollama list`.
+    """
+    result = subprocess.run(["ollama", "list"], check=True, capture_output=True, text=True)
+    # First line is the NAME/ID/SIZE header; the name is the first column
+    names = {line.split()[0] for line in result.stdout.splitlines()[1:] if line.strip()}
+    return model_name in names or f"{model_name}:latest" in names
+
 def download_qwen_model():
     """
     Downloads the Qwen3 model using Ollama.
     """
-    # Check Ollama is installed
-    try:
-        subprocess.run(["ollama", "--version"], check=True, capture_output=True)
-        print("✅ Ollama is installed.")
-    except subprocess.CalledProcessError:
+    # Check Ollama is installed without spawning a process
+    if shutil.which("ollama") is None:
         raise RuntimeError("❌ Ollama is not installed or not in PATH.")
+    print("✅ Ollama is installed.")
+
+    # Skip the pull round-trip if the model is already available
+    if is_model_downloaded(model):
+        print(f"✅ {model} is already downloaded and ready to use with Ollama.")
+        return
 
     # Download the model
     print("⬇️ Downloading Qwen3 model via Ollama...")
@@ -1,37 +1,119 @@
-import json
+import asyncio
+import os
 import re
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import httpx
+import orjson
 
 # Load API keys from .env
 load_dotenv()
 
-from langchain_ollama import OllamaLLM as LangchainOllama
 from langchain_openai import ChatOpenAI
 
+# Compiled once; clean_and_parse_json runs on every LLM response
+_MD_PREFIX = re.compile(r"^```(?:json)?\s*", re.IGNORECASE)
+_MD_SUFFIX = re.compile(r"\s*```$")
+
+
+def _extract_json_object(text: str) -> str | None:
+    """
+    Returns the first balanced {...} object in text using a single linear scan,
+    skipping braces that appear inside JSON strings. Returns None if there is none.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
 class AbstractLLM(ABC):
-    def __init__(self, model_name: str, temperature: float = 0.7, max_tokens: int = 1024):
+    # Number of requests the pipelines may keep in flight at once
+    max_concurrency = 1
+
+    def __init__(self, model_name: str, temperature: float = 0.7, max_tokens: int = 1024, max_concurrency: int | None = None):
         self.model_name = model_name
         self.temperature = temperature
         self.max_tokens = max_tokens
+        # Tune to the server, e.g. a vLLM/Ollama instance's parallel sequence limit
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
         self.llm = None  # To be initialized by subclasses
+        # Async clients are bound to the event loop that created them; see _async_client_for_loop
+        self._async_client = None
+        self._async_loop = None
+
+    def _async_client_for_loop(self, make_client):
+        """
+        Returns the async client for the running event loop, calling make_client() to
+        build one the first time it is used on that loop. Each asyncio.run() starts a
+        new loop, and a client made under an earlier, now closed loop fails there.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_client = make_client()
+            self._async_loop = loop
+        return self._async_client
 
     @abstractmethod
     def generate(self, prompt: str) -> str:
         pass
 
+    def generate_batch(self, prompts: list[str]) -> list[str]:
+        """Generates a response for each prompt, preserving input order."""
+        return [self.generate(prompt) for prompt in prompts]
+
+    async def agenerate(self, prompt: str) -> str:
+        """Async counterpart of generate; the default runs it on a worker thread."""
+        return await asyncio.to_thread(self.generate, prompt)
+
+    async def agenerate_batch(self, prompts: list[str]) -> list[str]:
+        """Generates all prompts concurrently, at most max_concurrency at a time."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def bounded(prompt: str) -> str:
+            async with semaphore:
+                return await self.agenerate(prompt)
+
+        return list(await asyncio.gather(*(bounded(prompt) for prompt in prompts)))
+
     def clean_and_parse_json(self, response: str):
         """Cleans markdown and extracts JSON content robustly."""
         response = response.strip()
-        response = re.sub(r"^```(?:json)?\s*", "", response, flags=re.IGNORECASE)
-        response = re.sub(r"\s*```$", "", response)
+        # A bare JSON object cannot carry markdown fences, so skip the regex work
+        if not (response[:1] == "{" and response[-1:] == "}"):
+            response = _MD_PREFIX.sub("", response)
+            response = _MD_SUFFIX.sub("", response)
 
+        # orjson parses in C; its JSONDecodeError subclasses json's, so callers see the same errors
         try:
-            return json.loads(response)
-        except json.JSONDecodeError as e:
-            match = re.search(r"\{.*\}", response, flags=re.DOTALL)
-            if match:
-                return json.loads(match.group(0))
+            return orjson.loads(response)
+        except orjson.JSONDecodeError as e:
+            body = _extract_json_object(response)
+            if body is not None:
+                return orjson.loads(body)
             raise ValueError(f"LLM did not return valid JSON: {response}") from e
 
     def generate_json(self, prompt: str, schema: dict) -> dict:
@@ -46,6 +128,9 @@ class AbstractLLM(ABC):
 
     @staticmethod
     def from_name(model_name: str, **kwargs) -> 'AbstractLLM':
+        # Any model behind an explicit OpenAI-compatible server (vLLM, llama.cpp, LM Studio, ...)
+        if "base_url" in kwargs:
+            return OpenAICompatibleLLM(model_name, **kwargs)
         if "gpt" in model_name.lower():
             return OpenAILLM(model_name, **kwargs)
         elif "qwen" in model_name.lower() or "llama" in model_name.lower():
@@ -54,25 +139,144 @@ class AbstractLLM(ABC):
             raise ValueError(f"Unknown model: {model_name}")
 
 class OllamaLLM(AbstractLLM):
+    # A local Ollama server only runs a couple of generations in parallel
+    max_concurrency = 2
+
     def __init__(self, model_name: str, **kwargs):
         super().__init__(model_name, **kwargs)
-        self.llm = LangchainOllama(model=model_name, temperature=self.temperature)
+        # Talk to the Ollama REST API directly over one keep-alive connection pool
+        host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+        if "://" not in host:
+            host = f"http://{host}"
+        self.base_url = host
+        self.llm = httpx.Client(
+            base_url=host,
+            timeout=None,
+            limits=httpx.Limits(max_keepalive_connections=self.max_concurrency)
+        )
+
+    def _request_body(self, prompt: str) -> dict:
+        return {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": False,
+            "options": {"temperature": self.temperature}
+        }
 
     def generate(self, prompt: str) -> str:
-        return self.llm.invoke(prompt)
+        response = self.llm.post("/api/generate", json=self._request_body(prompt))
+        response.raise_for_status()
+        return response.json()["response"]
+
+    async def agenerate(self, prompt: str) -> str:
+        client = self._async_client_for_loop(lambda: httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=None,
+            limits=httpx.Limits(max_keepalive_connections=self.max_concurrency)
+        ))
+        response = await client.post("/api/generate", json=self._request_body(prompt))
+        response.raise_for_status()
+        return response.json()["response"]
+
+    def generate_batch(self, prompts: list[str]) -> list[str]:
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(self.generate, prompts))
 
 
 class OpenAILLM(AbstractLLM):
+    max_concurrency = 8
+
     def __init__(self, model_name: str, **kwargs):
         super().__init__(model_name, **kwargs)
-        self.llm = ChatOpenAI(
-            model=model_name,
+        # Share one pooled client so every call reuses warm TLS connections
+        self._http = httpx.Client(
+            limits=httpx.Limits(max_keepalive_connections=self.max_concurrency)
+        )
+        self.llm = self._chat_model()
+
+    def _chat_model(self, http_async_client: httpx.AsyncClient | None = None) -> ChatOpenAI:
+        return ChatOpenAI(
+            model=self.model_name,
             temperature=self.temperature,
-            max_tokens=self.max_tokens
+            max_tokens=self.max_tokens,
+            http_client=self._http,
+            http_async_client=http_async_client
         )
 
+    def _async_llm(self) -> ChatOpenAI:
+        """
+        ChatOpenAI for the running event loop. Its async client would otherwise stay
+        bound to the loop of the first run, so a second run() would fail every entry.
+        """
+        return self._async_client_for_loop(lambda: self._chat_model(httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=self.max_concurrency)
+        )))
+
     def generate(self, prompt: str) -> str:
         return self.llm.invoke(prompt).content
+
+    def generate_batch(self, prompts: list[str]) -> list[str]:
+        return [message.content for message in self.llm.batch(prompts)]
+
+    async def agenerate(self, prompt: str) -> str:
+        return (await self._async_llm().ainvoke(prompt)).content
+
+    async def agenerate_batch(self, prompts: list[str]) -> list[str]:
+        messages = await self._async_llm().abatch(prompts, config={"max_concurrency": self.max_concurrency})
+        return [message.content for message in messages]
+
+
+class OpenAICompatibleLLM(AbstractLLM):
+    """
+    Talks to any OpenAI-compatible /chat/completions endpoint directly over httpx,
+    so runs on a self-hosted server share one event loop and connection pool
+    instead of a thread per in-flight request.
+    """
+    # Servers with continuous batching (e.g. vLLM) schedule many sequences at once
+    max_concurrency = 32
+
+    def __init__(self, model_name: str, base_url: str | None = None, api_key: str | None = None, **kwargs):
+        super().__init__(model_name, **kwargs)
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self._headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.llm = httpx.Client(
+            base_url=self.base_url,
+            headers=self._headers,
+            timeout=None,
+            limits=self._limits()
+        )
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+
+    def _request_body(self, prompt: str) -> dict:
+        return {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+
+    def generate(self, prompt: str) -> str:
+        response = self.llm.post("chat/completions", json=self._request_body(prompt))
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def agenerate(self, prompt: str) -> str:
+        client = self._async_client_for_loop(lambda: httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self._headers,
+            timeout=None,
+            limits=self._limits()
+        ))
+        response = await client.post("chat/completions", json=self._request_body(prompt))
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    def generate_batch(self, prompts: list[str]) -> list[str]:
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(self.generate, prompts))
     
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Stored next to .ta_pipeline_cache.sqlite, one level above src/
+CACHE_DIR = os.path.join(
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../../")), ".llm_prompt_cache"
+)
+
+# In-process front for repeats within a run (e.g. identical boilerplate answers)
+_MEMORY_SIZE = 4096
+_memory: OrderedDict[str, str] = OrderedDict()
+_lock = threading.Lock()
+
+
+def _key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def _path(key: str) -> str:
+    """Sharded by the first two hex digits so no single directory grows huge."""
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.json")
+
+
+def _remember(key: str, response: str):
+    with _lock:
+        _memory[key] = response
+        _memory.move_to_end(key)
+        if len(_memory) > _MEMORY_SIZE:
+            _memory.popitem(last=False)
+
+
+def _recall(key: str) -> str | None:
+    with _lock:
+        response = _memory.get(key)
+        if response is not None:
+            _memory.move_to_end(key)
+        return response
+
+
+def get(model: str, prompt: str) -> str | None:
+    """Returns the cached response for this exact model + prompt, or None on a miss."""
+    key = _key(model, prompt)
+    response = _recall(key)
+    if response is not None:
+        return response
+
+    try:
+        with open(_path(key), "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if record.get("prompt") != prompt:
+        return None
+
+    response = record["response"]
+    _remember(key, response)
+    return response
+
+
+def peek(model: str, prompt: str) -> str | None:
+    """Like get, but only checks the in-process cache, so it never touches the disk."""
+    return _recall(_key(model, prompt))
+
+
+def put(model: str, prompt: str, response: str):
+    """Stores a response, writing to a temp file first so readers never see a torn file."""
+    key = _key(model, prompt)
+    _remember(key, response)
+
+    path = _path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"prompt": prompt, "response": response}, ensure_ascii=False))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -1,50 +1,97 @@
 from abc import ABC, abstractmethod
 from src.llms.LLM_Wrappers import AbstractLLM
+from src.llms import prompt_cache
+from src.pipelines._cache_store import Store
 from tqdm import tqdm
-import json, copy, os
-from time import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio, functools, mmap, os, re
+import fastjsonschema
+import orjson
+from time import perf_counter_ns
+from typing import Iterable
+
+
+@functools.cache
+def _compiled_validator(schema_json: bytes):
+    """fastjsonschema.compile generates and execs Python source, so do it once per schema per process."""
+    return fastjsonschema.compile(orjson.loads(schema_json))
 
 class AbstractTAPipeline(ABC):
+    # The "Avg: ..s" postfix is only refreshed once every this many updates
+    POSTFIX_EVERY = 16
+    # Weight of the newest timing in the postfix's moving average
+    ELAPSED_EMA_ALPHA = 0.2
+    # Pending entries are dispatched in this many waves of similar text length
+    LENGTH_BINS = 4
+    # Non-answers ("N/A", "none", "-", "idk", "no comment") labelled Blank without a
+    # model call; set to None to only treat empty text as blank. A bare "no" is left
+    # to the model, since it is a real answer to yes/no questions
+    BLANK_PATTERN = re.compile(r"\s*(n/?a|none|nil|--?|idk|no (comment|response))\s*\.?\s*", re.IGNORECASE)
+
+    # {theme: {code: {"section": str, "confidence": number, "annotator": str}}}
+    ANNOTATION_SCHEMA = {
+        "type": "object",
+        "additionalProperties": {
+            "type": "object",
+            "additionalProperties": {
+                "type": "object",
+                "required": ["section", "confidence", "annotator"],
+                "properties": {
+                    "section": {"type": "string"},
+                    "confidence": {"type": "number"},
+                    "annotator": {"type": "string"},
+                },
+            },
+        },
+    }
+
     def __init__(
         self,
         llm: AbstractLLM,
         input_path: str,
         output_dir: str | None = None,
         output_name: str | None = None,
-        use_cache: bool = True
+        use_cache: bool = True,
+        batch_size: int = 1,
+        max_workers: int | None = None,
+        resume: bool = True
     ):
         self.llm = llm
         self.input_path = input_path
         self.output_dir = output_dir
         self.use_cache = use_cache
+        # Entries handed to annotate_batch together. On its own this still sends one prompt
+        # (and request) per entry through llm.generate_batch; SimplePromptPipeline's
+        # pack_batch packs a whole chunk into a single prompt
+        self.batch_size = max(1, batch_size)
+        # Default to whatever the backend can comfortably serve concurrently
+        self.max_workers = max_workers or llm.max_concurrency
+        # Reuse entries checkpointed by an interrupted run (or one that left entries failed)
+        self.resume = resume
 
         self.output_path = self._make_output_path(input_path, output_dir, output_name)
+        # Entries are appended here as they finish, so an interrupted run can resume
+        self.checkpoint_path = os.path.splitext(self.output_path)[0] + ".partial.jsonl"
 
         self.data = None
         self.codebook = None
+        # True while self.data is exactly what load_data read, so run() can reuse it
+        self._data_fresh = False
+        self._elapsed_ema = None
+        # Generated straight-line validator, compiled once rather than walking the schema per entry
+        self._annotation_validator = _compiled_validator(
+            orjson.dumps(self.ANNOTATION_SCHEMA, option=orjson.OPT_SORT_KEYS)
+        )
+        # Built once and copied onto each failed entry
+        self._model_name = llm.model_name
+        self._failed_annotations = self._single_code_annotations("Error", "AnnotationFailed", 0.0, self._model_name)
 
     # ---------- Cache Utilities ----------
 
     def _get_cache_path(self) -> str:
-        """Locate cache file one level above src/, named .ta_pipeline_cache.json."""
+        """Locate cache file one level above src/, named .ta_pipeline_cache.sqlite."""
         project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
-        return os.path.join(project_root, ".ta_pipeline_cache.json")
-
-    def _load_cache(self) -> dict:
-        if not os.path.exists(self.cache_path):
-            with open(self.cache_path, "w") as f:
-                json.dump({}, f)
-            return {}
-        try:
-            with open(self.cache_path, "r") as f:
-                return json.load(f)
-        except Exception:
-            return {}
-
-    def _save_cache(self, cache: dict):
-        with open(self.cache_path, "w") as f:
-            json.dump(cache, f, indent=2)
+        return os.path.join(project_root, ".ta_pipeline_cache.sqlite")
 
     def _get_pipeline_name(self) -> str:
         """Use __str__ if implemented, otherwise default to class name."""
@@ -61,35 +108,26 @@ class AbstractTAPipeline(ABC):
         if not self.use_cache:
             return None
 
-        cache = self._load_cache()
         input_file = os.path.basename(self.input_path)
         model_name = self.llm.model_name
         pipeline_name = self._get_pipeline_name()
 
-        try:
-            cached_entry = cache[input_file][model_name][pipeline_name]
-            cached_path = cached_entry["output_path"]
-            if os.path.exists(cached_path):
-                print(f"✅ Cached result found for {pipeline_name} ({model_name} on {input_file}).")
-                return cached_path
-        except KeyError:
+        cached_entry = Store(self.cache_path).get(input_file, model_name, pipeline_name)
+        if cached_entry is None:
             return None
+        cached_path = cached_entry["output_path"]
+        if os.path.exists(cached_path):
+            print(f"✅ Cached result found for {pipeline_name} ({model_name} on {input_file}).")
+            return cached_path
         return None
 
     def _update_cache(self):
         """Update cache after a successful run."""
-        cache = self._load_cache()
         input_file = os.path.basename(self.input_path)
         model_name = self.llm.model_name
         pipeline_name = self._get_pipeline_name()
 
-        cache.setdefault(input_file, {})
-        cache[input_file].setdefault(model_name, {})
-        cache[input_file][model_name][pipeline_name] = {
-            "output_path": self.output_path,
-            "timestamp": datetime.now().isoformat()
-        }
-        self._save_cache(cache)
+        Store(self.cache_path).put(input_file, model_name, pipeline_name, self.output_path)
 
     # ---------- Path + Data Handling ----------
 
@@ -111,13 +149,47 @@ class AbstractTAPipeline(ABC):
             return os.path.join(dir_name, annotated_name)
 
     def load_data(self):
-        with open(self.input_path, "r") as f:
-            self.data = json.load(f)
+        with open(self.input_path, "rb") as f:
+            try:
+                # Parse straight from the page cache rather than copying the file into a bytes object
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped; let orjson report the error
+                self.data = orjson.loads(f.read())
+            else:
+                with buf:
+                    self.data = orjson.loads(memoryview(buf))
         self.codebook = self.data["themes"]
+        self._data_fresh = True
 
     def save_data(self):
-        with open(self.output_path, "w") as f:
-            json.dump(self.data, f, indent=2)
+        with open(self.output_path, "wb", buffering=1 << 20) as f:
+            self._write_document(f, self.data)
+
+    @staticmethod
+    def _write_document(f, data: dict, answers: Iterable[dict] | None = None):
+        """
+        Writes data as 2-space indented JSON, serialising the answers one entry at a
+        time so a full indented copy of the document is never held in memory.
+        The bytes match orjson.dumps(data, option=OPT_INDENT_2). If answers is given,
+        it is written in place of data["answers"], each entry as soon as it is yielded.
+        """
+        option = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+        f.write(b"{")
+        for i, (key, value) in enumerate(data.items()):
+            f.write(b",\n  " if i else b"\n  ")
+            f.write(orjson.dumps(key) + b": ")
+            if key == "answers":
+                n_entries = 0
+                for entry in value if answers is None else answers:
+                    f.write(b",\n    " if n_entries else b"[\n    ")
+                    # Newlines inside JSON strings are escaped, so this only re-indents structure
+                    f.write(orjson.dumps(entry, option=option).replace(b"\n", b"\n    "))
+                    n_entries += 1
+                f.write(b"\n  ]" if n_entries else b"[]")
+            else:
+                f.write(orjson.dumps(value, option=option).replace(b"\n", b"\n  "))
+        f.write(b"\n}" if data else b"}")
 
     def _get_question_from_data(self) -> str:
         """Extracts the question text from the input data."""
@@ -126,40 +198,131 @@ class AbstractTAPipeline(ABC):
         print("⚠️ Warning: No question found in data.")
         return ""
 
+    # ---------- LLM Calls ----------
+
+    def _prompt_cache_model(self) -> str:
+        # Everything besides the prompt that shapes a response: temperature, max_tokens (a
+        # response truncated under a lower limit must not be replayed after it is raised)
+        # and, for self-hosted backends, the endpoint, since two servers can serve the same
+        # model name. At temperature > 0 a rerun still replays the first sampled response
+        # rather than drawing a new one; pass use_cache=False to resample
+        key = f"{self.llm.model_name}@{self.llm.temperature}/{self.llm.max_tokens}"
+        base_url = getattr(self.llm, "base_url", None)
+        return f"{key}@{base_url}" if base_url else key
+
+    def _generate(self, prompt: str) -> str:
+        """llm.generate, answered from the prompt cache when use_cache is on."""
+        if not self.use_cache:
+            return self.llm.generate(prompt)
+
+        model = self._prompt_cache_model()
+        response = prompt_cache.get(model, prompt)
+        if response is None:
+            response = self.llm.generate(prompt)
+            prompt_cache.put(model, prompt, response)
+        return response
+
+    def _generate_batch(self, prompts: list[str]) -> list[str]:
+        """
+        llm.generate_batch that only sends the prompts missing from the prompt cache.
+        Each prompt is still its own request; see SimplePromptPipeline.pack_batch.
+        """
+        if not self.use_cache:
+            return self.llm.generate_batch(prompts)
+
+        model = self._prompt_cache_model()
+        responses = [prompt_cache.get(model, prompt) for prompt in prompts]
+        missing = [i for i, response in enumerate(responses) if response is None]
+        if missing:
+            fresh = self.llm.generate_batch([prompts[i] for i in missing])
+            for i, response in zip(missing, fresh):
+                prompt_cache.put(model, prompts[i], response)
+                responses[i] = response
+        return responses
+
+    async def _agenerate(self, prompt: str) -> str:
+        """
+        Async counterpart of _generate. Only the in-process cache is checked on the
+        event loop; the disk cache is read and written on a worker thread, so other
+        requests in flight never wait on file I/O.
+        """
+        if not self.use_cache:
+            return await self.llm.agenerate(prompt)
+
+        model = self._prompt_cache_model()
+        response = prompt_cache.peek(model, prompt)
+        if response is None:
+            response = await asyncio.to_thread(prompt_cache.get, model, prompt)
+        if response is None:
+            response = await self.llm.agenerate(prompt)
+            await asyncio.to_thread(prompt_cache.put, model, prompt, response)
+        return response
+
     # ---------- Validation ----------
 
+    def _is_blank(self, text: str) -> bool:
+        """
+        True for empty or whitespace-only text (checked without building a stripped
+        copy), or for a non-answer matching BLANK_PATTERN.
+        """
+        if not text or text.isspace():
+            return True
+        return self.BLANK_PATTERN is not None and self.BLANK_PATTERN.fullmatch(text) is not None
+
     @abstractmethod
     def annotate_entry(self, entry: dict) -> dict:
         pass
 
+    def annotate_batch(self, entries: list[dict]) -> list[dict]:
+        """
+        Annotates a chunk of entries. The default falls back to one model call per
+        entry; subclasses override this to share a single model call across the chunk.
+        """
+        return [self.annotate_entry(entry) for entry in entries]
+
+    async def annotate_entry_async(self, entry: dict) -> dict:
+        """
+        Async counterpart of annotate_entry used by arun(). The default runs the
+        blocking version on a worker thread; subclasses override it to await the LLM.
+        """
+        return await asyncio.to_thread(self.annotate_entry, entry)
+
+    @staticmethod
+    def _single_code_annotations(theme: str, code: str, confidence: float, annotator: str) -> dict:
+        return {theme: {code: {"section": "", "confidence": confidence, "annotator": annotator}}}
+
+    def _error_entry(self, entry: dict, error: Exception) -> dict:
+        """Marks an entry whose annotation raised, so the run can carry on without it."""
+        entry["annotations"] = self._copy_annotations(self._failed_annotations)
+        return entry
+
+    def _annotate_safe(self, entry: dict) -> dict:
+        """annotate_entry that returns a well-formed error entry instead of raising."""
+        try:
+            return self.annotate_entry(entry)
+        except Exception as e:
+            return self._error_entry(entry, e)
+
+    @staticmethod
+    def _is_failed(entry: dict) -> bool:
+        return "AnnotationFailed" in entry.get("annotations", {}).get("Error", {})
+
     def validate_output(self, entry: dict):
         if "annotations" not in entry:
             raise ValueError("Missing 'annotations' field after annotation.")
         return True
 
     def validate_annotation_structure(self, annotations: dict) -> bool:
-        if not isinstance(annotations, dict):
+        try:
+            self._annotation_validator(annotations)
+        except fastjsonschema.JsonSchemaException:
             return False
-        for theme, codes in annotations.items():
-            if not isinstance(codes, dict):
-                return False
-            for code, details in codes.items():
-                if not isinstance(details, dict):
-                    return False
-                if not {"section", "confidence", "annotator"}.issubset(details.keys()):
-                    return False
-                if not isinstance(details["section"], str):
-                    return False
-                if not isinstance(details["confidence"], (int, float)):
-                    return False
-                if not isinstance(details["annotator"], str):
-                    return False
         return True
 
     # ---------- Main Run Logic ----------
 
-    def run(self) -> str:
-        """Runs the annotation pipeline with a live progress bar and caching support."""
+    def _start_run(self) -> str | None:
+        """Returns the cached output path if there is one, otherwise loads the input data."""
         # Check cache before running
         self.cache_path = self._get_cache_path()
         cached_path = self._check_cache()
@@ -167,36 +330,318 @@ class AbstractTAPipeline(ABC):
             print(f"Skipping run — returning cached file: {cached_path}")
             return cached_path
 
-        self.load_data()
-        annotated = copy.deepcopy(self.data)
-        entries = annotated["answers"]
-        total = len(entries)
-        processed = 0
-
-        with tqdm(total=total, desc="Annotating entries", unit="entry", ncols=90) as pbar:
-            for entry in entries:
-                text = entry.get("text", "").strip()
-                if text == "":
-                    entry = self.annotate_entry(entry)
-                    self.validate_output(entry)
-                    processed += 1
-                    pbar.update(1)
-                    continue
-
-                start_time = time()
-                entry = self.annotate_entry(entry)
-                self.validate_output(entry)
-                elapsed = time() - start_time
-
-                processed += 1
-                pbar.set_postfix_str(f"Last: {elapsed:.2f}s")
-                pbar.update(1)
-
-        self.data = annotated
+        # Skip the reload if the caller already loaded the data and nothing has touched it since
+        if not self._data_fresh:
+            self.load_data()
+        # Entries are annotated in place from here on
+        self._data_fresh = False
+        return None
+
+    def _annotate_blank_entries(self, entries: list[dict], pbar) -> list[int]:
+        """
+        Annotates blank entries on the calling thread, since they never reach the
+        model, and returns the indices of the entries that still need annotating.
+        """
+        pending = []
+        for idx, entry in enumerate(entries):
+            if self._is_blank(entry.get("text", "")):
+                entries[idx] = self.annotate_entry(entry)
+                self.validate_output(entries[idx])
+            else:
+                pending.append(idx)
+        # One bar update for the whole group rather than one per blank entry
+        pbar.update(len(entries) - len(pending))
+        return pending
+
+    def _checkpoint_signature(self) -> dict:
+        """Identifies what produced a checkpoint's entries; extended by subclasses with a prompt."""
+        return {"model": self._prompt_cache_model(), "pipeline": self._get_pipeline_name()}
+
+    def _open_checkpoint(self):
+        """
+        Opens the checkpoint for appending, starting it with a header line holding
+        _checkpoint_signature. A checkpoint whose header doesn't match (another
+        model, pipeline or prompt wrote to the same output path) is discarded.
+        """
+        header = orjson.dumps({"checkpoint": self._checkpoint_signature()}, option=orjson.OPT_SORT_KEYS) + b"\n"
+        try:
+            with open(self.checkpoint_path, "rb") as f:
+                stale = f.readline() != header
+        except FileNotFoundError:
+            stale = False
+        if stale:
+            print(f"Discarding {self.checkpoint_path}: it was written by a different model, pipeline or prompt.")
+            os.remove(self.checkpoint_path)
+
+        checkpoint = open(self.checkpoint_path, "ab")
+        if checkpoint.tell() == 0:
+            checkpoint.write(header)
+            checkpoint.flush()
+        return checkpoint
+
+    def _load_checkpoint(self) -> dict:
+        """Returns the entries checkpointed by an interrupted run, keyed by ID."""
+        if not os.path.exists(self.checkpoint_path):
+            return {}
+
+        done = {}
+        with open(self.checkpoint_path, "rb") as f:
+            f.readline()  # header, already checked by _open_checkpoint
+            for line in f:
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    break  # torn final line from a crash mid-write
+                done[entry["id"]] = entry
+        return done
+
+    def _resume_from_checkpoint(self, entries: list[dict], pending: list[int], pbar) -> list[int]:
+        """
+        Restores entries checkpointed by an earlier or interrupted run and returns the
+        indices that still need annotating. Entries whose text changed since, that
+        failed, or whose annotations are malformed are redone. Only the checkpoint is
+        trusted, since its header ties it to this model, pipeline and prompt; a saved
+        output file records none of these.
+        """
+        if not self.resume:
+            return pending
+
+        done = self._load_checkpoint()
+        if not done:
+            return pending
+
+        remaining = []
+        for idx in pending:
+            entry = done.get(entries[idx]["id"])
+            if (
+                entry is not None
+                and entry.get("text") == entries[idx].get("text")
+                and not self._is_failed(entry)
+                and self.validate_annotation_structure(entry["annotations"])
+            ):
+                entries[idx] = entry
+            else:
+                remaining.append(idx)
+        n_resumed = len(pending) - len(remaining)
+        if n_resumed:
+            pbar.update(n_resumed)
+            print(f"↻ Resumed {n_resumed} entries from an earlier run of {self.output_path}")
+        return remaining
+
+    @staticmethod
+    def _dedup_key(text: str) -> str:
+        return text.strip().lower()
+
+    def _group_duplicates(self, entries: list[dict], pending: list[int]) -> tuple[list[int], dict[int, list[int]]]:
+        """
+        Survey answers repeat a lot ("no", "none", "N/A"), so only the first entry of each
+        distinct text is sent to the model. Returns those indices, plus the indices of
+        the later duplicates keyed by the index whose annotations they will copy.
+        """
+        first_seen = {}
+        unique, duplicates = [], {}
+        for idx in pending:
+            first = first_seen.setdefault(self._dedup_key(entries[idx].get("text", "")), idx)
+            if first == idx:
+                unique.append(idx)
+            else:
+                duplicates.setdefault(first, []).append(idx)
+        return unique, duplicates
+
+    def _length_bins(self, entries: list[dict], pending: list[int]) -> list[list[int]]:
+        """
+        Splits pending into LENGTH_BINS equal-count waves by text length, shortest first.
+        Requests in flight together then take similar time, so short answers are not
+        left waiting behind the longest prompt of a mixed wave.
+        """
+        by_length = sorted(pending, key=lambda idx: len(entries[idx].get("text", "")))
+        size = -(-len(by_length) // self.LENGTH_BINS) or 1
+        return [by_length[start:start + size] for start in range(0, len(by_length), size)]
+
+    @staticmethod
+    def _copy_annotations(annotations: dict) -> dict:
+        """Copies {theme: {code: details}} down to the details dicts, so entries never share them."""
+        return {
+            theme: {code: dict(details) for code, details in codes.items()}
+            for theme, codes in annotations.items()
+        }
+
+    def _store_result(self, entries: list[dict], idx: int, entry: dict, duplicates: dict, checkpoint) -> int:
+        """
+        Writes an annotated entry back by index (so the output keeps the input order),
+        copies its annotations onto any duplicates of its text and checkpoints them all.
+        Returns the number of entries completed.
+        """
+        self.validate_output(entry)
+        entries[idx] = entry
+        checkpoint.write(orjson.dumps(entry) + b"\n")
+
+        dup_indices = duplicates.pop(idx, ())
+        for dup_idx in dup_indices:
+            duplicate = entries[dup_idx]
+            duplicate["annotations"] = self._copy_annotations(entry["annotations"])
+            checkpoint.write(orjson.dumps(duplicate) + b"\n")
+        return 1 + len(dup_indices)
+
+    def _finish_run(self) -> str:
         self.save_data()
+        print(f"Annotated JSON written to {self.output_path}")
+
+        n_failed = sum(self._is_failed(entry) for entry in self.data["answers"])
+        if n_failed:
+            # Not a complete result (e.g. the API was down): keep it out of the run cache
+            # and keep the checkpoint, so the next run() only retries the failed entries
+            print(f"⚠️ {n_failed} entries failed to annotate; rerun to retry them.")
+            return self.output_path
+
+        # The full document is on disk now, so the checkpoint is no longer needed
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
 
         # Update cache after successful run
         self._update_cache()
-
-        print(f"Annotated JSON written to {self.output_path}")
         return self.output_path
+
+    def _annotate_chunk(self, chunk: list[dict]) -> tuple[list[dict], int]:
+        """Annotates one chunk on a worker thread and reports how long it took, in ns."""
+        start_ns = perf_counter_ns()
+        try:
+            results = self.annotate_batch(chunk)
+        except Exception:
+            # Retry entry by entry so one bad entry (or request) only fails itself
+            # instead of taking down the chunk and the rest of the pool with it
+            results = [self._annotate_safe(entry) for entry in chunk]
+        return results, perf_counter_ns() - start_ns
+
+    def _progress_bar(self, total: int) -> tqdm:
+        """
+        Progress bar shared by the run methods. Redraws are limited to twice a second,
+        since fast paths (blanks, cache hits) can otherwise finish many entries per redraw.
+        """
+        self._elapsed_ema = None
+        return tqdm(total=total, desc="Annotating entries", unit="entry", ncols=90, mininterval=0.5)
+
+    def _report_progress(self, pbar, n_done: int, elapsed_ns: int, n_updates: int):
+        """
+        Advances the progress bar and folds elapsed_ns into a moving average of
+        call times, formatting the postfix only every POSTFIX_EVERY updates.
+        """
+        if self._elapsed_ema is None:
+            self._elapsed_ema = elapsed_ns
+        else:
+            self._elapsed_ema += self.ELAPSED_EMA_ALPHA * (elapsed_ns - self._elapsed_ema)
+        if n_updates % self.POSTFIX_EVERY == 0:
+            pbar.set_postfix_str(f"Avg: {self._elapsed_ema / 1e9:.2f}s", refresh=False)
+        pbar.update(n_done)
+
+    def _prefers_async(self) -> bool:
+        """
+        True when both the LLM and this pipeline have native async implementations,
+        so one event loop can replace the worker threads. Batched chunks only have
+        a blocking implementation, so they stay on threads.
+        """
+        return (
+            self.batch_size == 1
+            and type(self.llm).agenerate is not AbstractLLM.agenerate
+            and type(self).annotate_entry_async is not AbstractTAPipeline.annotate_entry_async
+        )
+
+    def run(self) -> str:
+        """
+        Runs the annotation pipeline with a live progress bar and caching support,
+        on an event loop when the LLM supports async calls and on threads otherwise.
+        """
+        if self._prefers_async():
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return asyncio.run(self._run_async())
+            # Already inside an event loop (e.g. Jupyter), which asyncio.run can't nest in
+        return self._run_threaded()
+
+    def _run_threaded(self) -> str:
+        cached_path = self._start_run()
+        if cached_path:
+            return cached_path
+
+        # self.data is freshly read from disk, so annotate its entries in place
+        entries = self.data["answers"]
+        total = len(entries)
+
+        with self._progress_bar(total) as pbar, self._open_checkpoint() as checkpoint:
+            pending = self._annotate_blank_entries(entries, pbar)
+            pending = self._resume_from_checkpoint(entries, pending, pbar)
+            pending, duplicates = self._group_duplicates(entries, pending)
+            n_updates = 0
+
+            # Model calls are network-bound, so overlap them across worker threads,
+            # one length bin at a time
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                try:
+                    for length_bin in self._length_bins(entries, pending):
+                        futures = {
+                            executor.submit(self._annotate_chunk, [entries[idx] for idx in chunk]): chunk
+                            for chunk in (
+                                length_bin[start:start + self.batch_size]
+                                for start in range(0, len(length_bin), self.batch_size)
+                            )
+                        }
+                        for future in as_completed(futures):
+                            chunk = futures[future]
+                            results, elapsed = future.result()
+
+                            n_done = sum(
+                                self._store_result(entries, idx, entry, duplicates, checkpoint)
+                                for idx, entry in zip(chunk, results)
+                            )
+                            checkpoint.flush()
+
+                            self._report_progress(pbar, n_done, elapsed, n_updates)
+                            n_updates += 1
+                except BaseException:
+                    # Cancel the chunks still queued, so an interrupt (e.g. Ctrl-C) only waits
+                    # for the calls already in flight rather than the rest of the bin
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+
+        return self._finish_run()
+
+    async def arun(self) -> str:
+        """
+        Async variant of run() that keeps up to max_workers annotate_entry_async
+        calls in flight on the current event loop.
+        """
+        return await self._run_async()
+
+    async def _run_async(self) -> str:
+        cached_path = self._start_run()
+        if cached_path:
+            return cached_path
+
+        entries = self.data["answers"]
+        semaphore = asyncio.Semaphore(self.max_workers)
+        n_updates = 0
+
+        async def annotate(idx: int, pbar, checkpoint, duplicates: dict):
+            nonlocal n_updates
+            async with semaphore:
+                start_ns = perf_counter_ns()
+                try:
+                    entry = await self.annotate_entry_async(entries[idx])
+                except Exception as e:
+                    entry = self._error_entry(entries[idx], e)
+                elapsed = perf_counter_ns() - start_ns
+
+            n_done = self._store_result(entries, idx, entry, duplicates, checkpoint)
+            checkpoint.flush()
+            self._report_progress(pbar, n_done, elapsed, n_updates)
+            n_updates += 1
+
+        with self._progress_bar(len(entries)) as pbar, self._open_checkpoint() as checkpoint:
+            pending = self._annotate_blank_entries(entries, pbar)
+            pending = self._resume_from_checkpoint(entries, pending, pbar)
+            pending, duplicates = self._group_duplicates(entries, pending)
+            for length_bin in self._length_bins(entries, pending):
+                await asyncio.gather(*(annotate(idx, pbar, checkpoint, duplicates) for idx in length_bin))
+
+        return self._finish_run()
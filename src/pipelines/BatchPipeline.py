@@ -0,0 +1,161 @@
+import os
+import time
+import orjson
+from openai import OpenAI
+from src.llms import prompt_cache
+from src.llms.LLM_Wrappers import AbstractLLM
+
+
+class BatchPipeline:
+    """
+    Mixin for SimplePromptPipeline subclasses that annotates a whole file through
+    the OpenAI Batch API instead of one chat request per entry. Batches are billed
+    at a discount and finish within the completion window rather than in real time.
+
+    Usage: class BatchBetterPromptDescPipeline(BatchPipeline, BetterPromptDescPipeline)
+    """
+    # Seconds between status checks while the batch is running
+    batch_poll_interval = 30
+    batch_completion_window = "24h"
+
+    def _batch_request(self, entry: dict, prompt: str) -> dict:
+        return {
+            "custom_id": str(entry["id"]),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": self.llm.model_name,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": self.llm.temperature,
+                "max_tokens": self.llm.max_tokens,
+            },
+        }
+
+    def emit_batch(self, jsonl_path: str) -> dict[str, str]:
+        """
+        Writes one Batch API request per entry that still needs the model to
+        jsonl_path, and returns the prompts keyed by custom_id. Blank entries are
+        annotated directly, and prompts already in the prompt cache are answered
+        from it, so neither is sent.
+        """
+        if self.data is None:
+            self.load_data()
+
+        model = self._prompt_cache_model()
+        prompts = {}
+        with open(jsonl_path, "wb") as f:
+            for entry in self.data["answers"]:
+                text = entry.get("text", "")
+                if self._is_blank(text):
+                    self._annotate_blank(entry)
+                    continue
+
+                prompt = self._build_prompt(text.strip())
+                cached = prompt_cache.get(model, prompt) if self.use_cache else None
+                if cached is not None:
+                    self._apply_response(entry, cached)
+                    continue
+
+                request = self._batch_request(entry, prompt)
+                prompts[request["custom_id"]] = prompt
+                f.write(orjson.dumps(request) + b"\n")
+        return prompts
+
+    def _submit_batch(self, client: OpenAI, jsonl_path: str):
+        with open(jsonl_path, "rb") as f:
+            batch_file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.batch_completion_window,
+        )
+        self.log(f"Submitted batch {batch.id} ({jsonl_path})")
+
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(self.batch_poll_interval)
+            batch = client.batches.retrieve(batch.id)
+
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'.")
+        return batch
+
+    def _read_batch_output(self, client: OpenAI, batch) -> dict[str, str]:
+        """Maps custom_id to response text for every request that succeeded."""
+        responses = {}
+        if not batch.output_file_id:
+            return responses
+
+        for line in client.files.content(batch.output_file_id).content.splitlines():
+            record = orjson.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                self.log(f"Entry {record['custom_id']}: batch request failed: {record.get('error') or response}")
+                continue
+            responses[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+        return responses
+
+    def run_batch(self, jsonl_path: str | None = None) -> str:
+        """
+        Runs the pipeline as a single Batch API job: emit the requests, submit
+        them, wait for the batch to finish, then apply the responses.
+        """
+        self.log(f"=== Batch pipeline started for {self.input_path} using {self._model_name} ===")
+        try:
+            cached_path = self._start_run()
+            if cached_path:
+                return cached_path
+
+            jsonl_path = jsonl_path or os.path.splitext(self.output_path)[0] + ".batch.jsonl"
+            prompts = self.emit_batch(jsonl_path)
+
+            if prompts:
+                client = OpenAI()
+                batch = self._submit_batch(client, jsonl_path)
+                responses = self._read_batch_output(client, batch)
+
+                model = self._prompt_cache_model()
+                for entry in self.data["answers"]:
+                    custom_id = str(entry["id"])
+                    if custom_id not in prompts:
+                        continue
+                    response = responses.get(custom_id)
+                    if response is None:
+                        self._error_entry(entry, RuntimeError("missing from batch output"))
+                        continue
+                    if self.use_cache:
+                        prompt_cache.put(model, prompts[custom_id], response)
+                    self._apply_response(entry, response)
+
+            for entry in self.data["answers"]:
+                self.validate_output(entry)
+
+            output_path = self._finish_run()
+            self.log(f"Pipeline completed successfully. Output at {output_path}")
+        except Exception as e:
+            self.log(f"Pipeline failed: {e}")
+            self.flush_log()
+            raise
+        finally:
+            self.log_file.close()
+            print(f"Logs saved to {self.log_path}")
+        return output_path
+
+
+# ----------------------------------------------------------------------
+# Example usage
+# ----------------------------------------------------------------------
+if __name__ == "__main__":
+    from src.pipelines.BetterPromptPipeline import BetterPromptDescPipeline
+
+    class BatchBetterPromptDescPipeline(BatchPipeline, BetterPromptDescPipeline):
+        def __str__(self):
+            return "BatchBetterPromptDescPipeline"
+
+    llm = AbstractLLM.from_name("gpt-4o-mini")
+    pipeline = BatchBetterPromptDescPipeline(
+        llm,
+        "src/data/test.json",
+        output_dir="outputs/",
+        output_name="gpt-4o-mini-batch"
+    )
+    pipeline.run_batch()
@@ -1,10 +1,9 @@
-import json, os
-from datetime import datetime
 from src.llms.LLM_Wrappers import AbstractLLM
-from src.pipelines.AbstractTAPipeline import AbstractTAPipeline
 from src.pipelines.SimplePromptPipeline import SimplePromptPipeline
 
 class BetterPromptDescPipeline(SimplePromptPipeline):
+    log_tag = " (better desc mode)"
+
     def __str__(self):
         return "BetterPromptDescPipeline"
 
@@ -23,29 +22,13 @@ class BetterPromptDescPipeline(SimplePromptPipeline):
                 formatted[theme] = [{"code": c, "description": ""} for c in codes]
         return formatted
 
-    def annotate_entry(self, entry: dict) -> dict:
-        text = entry.get("text", "").strip()
-
-        # --- Handle blank text ----
-        if not text:
-            entry["annotations"] = {
-                "No Responses": {
-                    "Blank": {
-                        "section": "",
-                        "confidence": 1.0,
-                        "annotator": self.llm.model_name
-                    }
-                }
-            }
-            self.log(f"Entry {entry['id']}: Blank text — annotated with 'Blank' code.")
-            return entry
-
+    def _make_prompt_template(self) -> str:
         # --- Prepare codebook and question ----
         codebook_for_prompt = self._format_codebook()
         question_str = self._get_question_from_data()
 
         # --- Improved Prompt ---
-        prompt = f"""
+        return f"""
 You are a highly accurate thematic annotator. You will receive a survey question, a response, 
 and a detailed codebook. Your job is to determine which themes and codes apply to the response.
 You must follow all rules exactly and output ONLY valid JSON.
@@ -76,8 +59,7 @@ OUTPUT SCHEMA (follow exactly)
     "<theme-name>": {{
       "<code-name>": {{
         "section": "[start:end]" or "",
-        "confidence": 0.0-1.0,
-        "annotator": "{self.llm.model_name}"
+        "confidence": 0.0-1.0
       }}
     }}
   }}
@@ -91,55 +73,16 @@ QUESTION
 =====================
 CODEBOOK
 =====================
-{json.dumps(codebook_for_prompt, indent=2)}
+{self._compact_json(codebook_for_prompt)}
 
 =====================
 RESPONSE TEXT
 =====================
-{json.dumps(text)}
+{self.TEXT_SLOT}
 
 Return ONLY the JSON object.
 """
 
-        # --- Generate LLM output ---
-        response = self.llm.generate(prompt)
-
-        # --- Parse + Validate JSON ---
-        try:
-            result = self.llm.clean_and_parse_json(response)
-            annotation = result.get("annotations", {})
-
-            if self.validate_annotation_structure(annotation):
-                entry["annotations"] = annotation
-                self.log(f"Entry {entry['id']}: JSON processed successfully (better desc mode).")
-            else:
-                self.log(f"Entry {entry['id']}: Invalid JSON schema (better desc mode).")
-                self.log(f"Raw LLM output:\n{response}\n{'-'*60}")
-                entry["annotations"] = {
-                    "Error": {
-                        "InvalidFormat": {
-                            "section": "",
-                            "confidence": 0.0,
-                            "annotator": self.llm.model_name
-                        }
-                    }
-                }
-
-        except Exception as e:
-            self.log(f"Entry {entry['id']}: JSON parsing error (better desc mode): {e}")
-            self.log(f"Raw LLM output:\n{response}\n{'-'*60}")
-            entry["annotations"] = {
-                "Error": {
-                    "InvalidJSON": {
-                        "section": "",
-                        "confidence": 0.0,
-                        "annotator": self.llm.model_name
-                    }
-                }
-            }
-
-        return entry
-
 
 # ----------------------------------------------------------------------
 # Example usage
@@ -147,8 +90,8 @@ Return ONLY the JSON object.
 if __name__ == "__main__":
     llm = AbstractLLM.from_name("gpt-4o-mini")
 
-    # Normal (ignores descriptions)
-    pipeline = BetterPromptPipeline(
+    # Uses the code descriptions
+    pipeline = BetterPromptDescPipeline(
         llm,
         "src/data/test.json",
         output_dir="outputs/",
@@ -1,9 +1,7 @@
 import json
 import os
-import copy
-from tqdm import tqdm
-from time import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter_ns
 from src.llms.LLM_Wrappers import AbstractLLM
 from src.pipelines.SimplePromptPipeline import SimplePromptPipeline # Assuming SimplePromptPipeline is imported from a relevant path
 
@@ -16,20 +14,41 @@ class FewShotPipeline(SimplePromptPipeline):
         output_dir: str | None = None,
         output_name: str | None = None,
         log_dir: str = "logs",
-        use_cache: bool = True
+        use_cache: bool = True,
+        batch_size: int = 1,
+        max_workers: int | None = None,
+        resume: bool = True,
+        pack_batch: bool = False
     ):
         # We must change the default output name to reflect the partial save
         if output_name is None:
              output_name = "partial_few_shot"
         
-        super().__init__(llm, input_path, output_dir, output_name, log_dir, use_cache)
+        super().__init__(llm, input_path, output_dir, output_name, log_dir, use_cache, batch_size, max_workers, resume, pack_batch)
         self.example_ids = example_ids
         self.examples_context = "" 
-        self.llm_annotator_tag = f"{self.llm.model_name}_llm" # Updated annotator tag
+        self._entry_map: dict = {}  # entry ID -> entry of self.data, rebuilt whenever self.data is replaced
+        self.llm_annotator_tag = f"{self._model_name}_llm" # Updated annotator tag
+        # Empty texts are marked as human (Blank/NoRelevant are usually pre-labeled); non-answers
+        # matched by BLANK_PATTERN are the pipeline's judgement, so like errors they carry the LLM tag
+        self._blank_annotations = self._single_code_annotations("No Responses", "Blank", 1.0, "human")
+        self._pattern_blank_annotations = self._single_code_annotations("No Responses", "Blank", 1.0, self.llm_annotator_tag)
+        self._invalid_format_annotations = self._single_code_annotations("Error", "InvalidFormat", 0.0, self.llm_annotator_tag)
+        self._invalid_json_annotations = self._single_code_annotations("Error", "InvalidJSON", 0.0, self.llm_annotator_tag)
 
     def __str__(self):
         return "FewShotPipeline"
 
+    def load_data(self):
+        super().load_data()
+        self._entry_map = {entry['id']: entry for entry in self.data['answers']}
+        # run() annotates self.data in place, so capture the human-annotated
+        # examples before any entry is overwritten
+        self.examples_context = self._build_examples_context()
+        # Serialise the codebook + examples preamble once here, rather than letting
+        # each worker thread race to build the multi-KB prefix on its first entry
+        self._prompt_parts = self._make_prompt_parts()
+
     def _build_examples_context(self):
         """
         Retrieves the text and existing annotations for the provided example_ids
@@ -38,11 +57,10 @@ class FewShotPipeline(SimplePromptPipeline):
         if not self.data:
             self.load_data()
 
-        entry_map = {entry['id']: entry for entry in self.data['answers']}
         examples_list = []
         
         for ex_id in self.example_ids:
-            entry = entry_map.get(ex_id)
+            entry = self._entry_map.get(ex_id)
             if entry is None:
                 self.log(f"⚠️ Warning: Example ID {ex_id} not found in data. Skipping.")
                 continue
@@ -66,64 +84,53 @@ class FewShotPipeline(SimplePromptPipeline):
 
         return "\n\n---\n\n".join(examples_list)
 
-    def annotate_entry(self, entry: dict) -> dict:
+    def _annotate_blank(self, entry: dict) -> dict:
+        # Retain 1.0 confidence for a definitive blank, without a log line
+        text = entry.get("text", "")
+        blank = self._blank_annotations if not text or text.isspace() else self._pattern_blank_annotations
+        entry["annotations"] = self._copy_annotations(blank)
+        return entry
+
+    def _make_prompt_template(self) -> str:
         """
-        Overriding the annotation logic to include examples and updated instructions.
+        Overriding the prompt to include examples and updated instructions.
         """
-        text = entry.get("text", "").strip()
-        
-        # 1. Handle blank text
-        if not text:
-            # Preserve existing human annotation structure if possible, but update annotator
-            entry["annotations"] = {
-                "No Responses": {
-                    "Blank": {
-                        "section": "",
-                        "confidence": 1.0, # Retain 1.0 for definitive blank
-                        "annotator": "human" # Assuming Blank/NoRelevant are usually pre-labeled
-                    }
-                }
-            }
-            return entry
-
-        # 2. Lazy load examples context
+        # 1. Lazy load examples context
         if not self.examples_context:
             self.examples_context = self._build_examples_context()
 
-        # 3. Format codebook
+        # 2. Format codebook
         codebook_for_prompt = self._format_codebook()
 
-        # 4. Construct Few-Shot Prompt with updated confidence instruction
-        prompt = f"""
-        You are a thematic annotator. I will provide you with a Codebook and several labeled Examples. 
-        Your task is to annotate the "Target Text" following the patterns shown in the examples.
-        
-        Return **only** a JSON object (no markdown, no explanations).
+        # 3. Construct Few-Shot Prompt with updated confidence instruction
+        return f"""
+You are a thematic annotator. I will provide you with a Codebook and several labeled Examples.
+Your task is to annotate the "Target Text" following the patterns shown in the examples.
 
-        **Crucially, you must assign a `confidence` rating as a float between 0.0 (low) and 1.0 (high) based on how certain you are of the annotation.**
-        
-        === CODEBOOK ===
-        {json.dumps(codebook_for_prompt, indent=2)}
-
-        === EXAMPLES ===
-        {self.examples_context}
-
-        === TARGET TEXT ===
-        Input: {json.dumps(text)}
-
-        Output format:
-        {{
-          "annotations": {{
-            "theme_name": {{
-              "code_name": {{"section": "[substring]", "confidence": float, "annotator": "{self.llm_annotator_tag}"}}
-            }}
-          }}
-        }}
-        """
+Return **only** a JSON object (no markdown, no explanations).
+
+**Crucially, you must assign a `confidence` rating as a float between 0.0 (low) and 1.0 (high) based on how certain you are of the annotation.**
 
-        # 5. Generate + parse JSON (using parent's logging/parsing logic)
-        response = self.llm.generate(prompt)
+=== CODEBOOK ===
+{self._compact_json(codebook_for_prompt)}
 
+=== EXAMPLES ===
+{self.examples_context}
+
+Output format:
+{{
+  "annotations": {{
+    "theme_name": {{
+      "code_name": {{"section": "[substring]", "confidence": float}}
+    }}
+  }}
+}}
+
+=== TARGET TEXT ===
+Input: {self.TEXT_SLOT}
+"""
+
+    def _apply_response(self, entry: dict, response: str) -> dict:
         try:
             result = self.llm.clean_and_parse_json(response)
             annotation = result.get("annotations", {})
@@ -145,27 +152,11 @@ class FewShotPipeline(SimplePromptPipeline):
                 self.log(f"Entry {entry['id']}: JSON processed successfully.")
             else:
                 self.log(f"Entry {entry['id']}: Invalid format received.")
-                entry["annotations"] = {
-                    "Error": {
-                        "InvalidFormat": {
-                            "section": "",
-                            "confidence": 0.0,
-                            "annotator": self.llm_annotator_tag
-                        }
-                    }
-                }
+                entry["annotations"] = self._copy_annotations(self._invalid_format_annotations)
 
         except Exception as e:
             self.log(f"Entry {entry['id']}: JSON parsing error: {e}")
-            entry["annotations"] = {
-                "Error": {
-                    "InvalidJSON": {
-                        "section": "",
-                        "confidence": 0.0,
-                        "annotator": self.llm_annotator_tag
-                    }
-                }
-            }
+            entry["annotations"] = self._copy_annotations(self._invalid_json_annotations)
 
         return entry
 
@@ -179,15 +170,8 @@ class FewShotPipeline(SimplePromptPipeline):
         if self.data is None:
             self.load_data()
 
-        # Find the target entry and its original index
-        target_entry = None
-        target_index = -1
-        
-        for idx, entry in enumerate(self.data["answers"]):
-            if entry["id"] == target_id:
-                target_entry = entry
-                target_index = idx
-                break
+        # Find the target entry
+        target_entry = self._entry_map.get(target_id)
         
         if target_entry is None:
             msg = f"❌ Error: Entry ID {target_id} not found in input file."
@@ -195,22 +179,19 @@ class FewShotPipeline(SimplePromptPipeline):
             self.log(msg)
             return {}
 
-        # 1. Annotate the target entry
-        annotated_target_entry = self.annotate_entry(copy.deepcopy(target_entry))
+        # 1. Annotate the target entry (annotate_entry replaces "annotations" rather than
+        # mutating it, so a shallow copy is enough to leave the source data untouched)
+        annotated_target_entry = self.annotate_entry(dict(target_entry))
         
         # 2. Collect entries for the new output file (Tweak 1)
         
-        # Start with the original data structure (copy everything but answers)
-        new_data = copy.deepcopy(self.data)
-        new_data["answers"] = []
-        
-        # Map of all entries for easy lookup
-        entry_map = {entry['id']: entry for entry in self.data['answers']}
+        # Start with the original data structure (share everything but answers)
+        new_data = dict(self.data, answers=[])
         
         # Add all example entries (with their original human annotations)
         for ex_id in self.example_ids:
-            if ex_id in entry_map:
-                new_data["answers"].append(entry_map[ex_id])
+            if ex_id in self._entry_map:
+                new_data["answers"].append(self._entry_map[ex_id])
         
         # Add the newly annotated target entry
         new_data["answers"].append(annotated_target_entry)
@@ -223,10 +204,13 @@ class FewShotPipeline(SimplePromptPipeline):
             
         # Update the main data object for the final save
         self.data = new_data
+        self._data_fresh = False
+        self._entry_map = {entry['id']: entry for entry in new_data['answers']}
         self.save_data()
 
         self.log(f"Entry {target_id} annotated and saved to {self.output_path}. File contains examples + target only.")
         print(f"✅ Entry {target_id} annotated and saved (partial file) to {self.output_path}")
+        self.flush_log()
         
         return annotated_target_entry
     
@@ -240,17 +224,21 @@ class FewShotPipeline(SimplePromptPipeline):
         if self.data is None:
             self.load_data()
 
-        # Map of all entries for easy lookup
-        entry_map = {entry['id']: entry for entry in self.data['answers']}
-        
         annotated_entries = []
+        # Written next to the output and moved over it once complete, so a failed run leaves the old file intact
+        tmp_path = self.output_path + ".tmp"
+        
+        def annotate(target_entry: dict) -> tuple[dict, int]:
+            start_ns = perf_counter_ns()
+            # 1. Annotate the target entry (on a shallow copy to avoid mutating source data)
+            annotated_target_entry = self._annotate_safe(dict(target_entry))
+            return annotated_target_entry, perf_counter_ns() - start_ns
         
         # Use tqdm for progress tracking
-        with tqdm(total=len(target_ids), desc="Annotating entries", unit="entry", ncols=90) as pbar:
+        with self._progress_bar(len(target_ids)) as pbar:
+            targets = []
             for target_id in target_ids:
-                start_time = time()
-                
-                target_entry = entry_map.get(target_id)
+                target_entry = self._entry_map.get(target_id)
                 
                 if target_entry is None:
                     msg = f"❌ Error: Entry ID {target_id} not found in input file. Skipping."
@@ -258,40 +246,53 @@ class FewShotPipeline(SimplePromptPipeline):
                     print(msg)
                     pbar.update(1)
                     continue
+                targets.append(target_entry)
 
-                # 1. Annotate the target entry (using a deepcopy to avoid mutating source data)
-                annotated_target_entry = self.annotate_entry(copy.deepcopy(target_entry))
-                
-                # 2. Validation
-                try:
-                    self.validate_output(annotated_target_entry)
-                except ValueError as e:
-                    self.log(f"Entry {target_id} Validation failed: {e}")
-                
-                annotated_entries.append(annotated_target_entry)
-                
-                elapsed = time() - start_time
-                pbar.set_postfix_str(f"Last: {elapsed:.2f}s")
-                pbar.update(1)
+            def annotated(executor: ThreadPoolExecutor):
+                futures = [executor.submit(annotate, target_entry) for target_entry in targets]
+                # Results are taken in submission order, so the output keeps the target order
+                for n_updates, future in enumerate(futures):
+                    annotated_target_entry, elapsed = future.result()
+                    target_id = annotated_target_entry["id"]
 
-        # 3. Collect entries for the new output file (Selective Saving)
-        
-        new_data = copy.deepcopy(self.data)
-        new_data["answers"] = []
-        
-        # # Add all example entries (with their original human annotations)
-        # for ex_id in self.example_ids:
-        #     if ex_id in entry_map:
-        #         new_data["answers"].append(entry_map[ex_id])
-        
-        # Add the newly annotated target entries
-        new_data["answers"].extend(annotated_entries)
-        
-        # 4. Save to disk
-        self.data = new_data
-        self.save_data()
+                    # 2. Validation
+                    try:
+                        self.validate_output(annotated_target_entry)
+                    except ValueError as e:
+                        self.log(f"Entry {target_id} Validation failed: {e}")
+                    
+                    annotated_entries.append(annotated_target_entry)
+                    
+                    self._report_progress(pbar, 1, elapsed, n_updates)
+                    yield annotated_target_entry
+
+            # 3. Stream the new output file (Selective Saving): it holds only the annotated
+            # targets, each written as soon as it and the entries before it are done.
+            # Model calls are network-bound, so overlap them across worker threads
+            try:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor, \
+                        open(tmp_path, "wb", buffering=1 << 20) as f:
+                    try:
+                        self._write_document(f, dict(self.data, answers=[]), answers=annotated(executor))
+                    except BaseException:
+                        # Cancel the targets still queued, so an interrupt (e.g. Ctrl-C) only
+                        # waits for the calls already in flight
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        raise
+            except BaseException:
+                # Don't leave the half-written file behind
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        # 4. Publish the file and make it the pipeline's data
+        os.replace(tmp_path, self.output_path)
+        self.data = dict(self.data, answers=annotated_entries)
+        self._data_fresh = False
+        self._entry_map = {entry['id']: entry for entry in self.data['answers']}
 
         self.log(f"Annotated batch saved to {self.output_path}. File contains examples + targets only.")
         print(f"✅ Annotated batch of {len(target_ids)} entries saved (partial file) to {self.output_path}")
+        self.flush_log()
         
         return annotated_entries
\ No newline at end of file
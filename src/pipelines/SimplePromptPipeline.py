@@ -1,10 +1,30 @@
-import json, os
-from datetime import datetime
+import hashlib, os, re, string, threading
+import orjson
+from collections import OrderedDict
+# Bound once at import: log() runs on every entry, and these skip the module attribute lookups
+from time import localtime as _localtime, strftime as _strftime, time as _time
 from src.llms.LLM_Wrappers import AbstractLLM
 from src.pipelines.AbstractTAPipeline import AbstractTAPipeline
+from src.pipelines._log_writer import LogWriter
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING = string.punctuation + " "
 
 
 class SimplePromptPipeline(AbstractTAPipeline):
+    # Appended to per-entry log lines so variants can be told apart
+    log_tag = ""
+    # Most annotations kept in the in-process annotation cache
+    ANNOTATION_CACHE_SIZE = 10_000
+    # Marks where the JSON-encoded response text goes in a prompt template
+    TEXT_SLOT = "<<TEXT>>"
+    # Appended to a packed prompt, whose TEXT_SLOT holds a JSON array of entries
+    PACKED_INSTRUCTIONS = """
+The text above is a JSON array of {"id": ..., "text": ...} objects. Annotate each text independently,
+exactly as instructed for a single text, and return only one JSON object keyed by id:
+{"<id>": {"annotations": {...}}, ...}
+"""
+
     def __init__(
         self,
         llm: AbstractLLM,
@@ -12,25 +32,67 @@ class SimplePromptPipeline(AbstractTAPipeline):
         output_dir: str | None = None,
         output_name: str | None = None,
         log_dir: str = "logs",
-        use_cache: bool = True
+        use_cache: bool = True,
+        batch_size: int = 1,
+        max_workers: int | None = None,
+        resume: bool = True,
+        pack_batch: bool = False
     ):
-        super().__init__(llm, input_path, output_dir, output_name, use_cache)
+        super().__init__(llm, input_path, output_dir, output_name, use_cache, batch_size, max_workers, resume)
+        # With batch_size > 1, send each chunk as one prompt instead of one prompt per entry
+        self.pack_batch = pack_batch
         self.log_dir = log_dir
         os.makedirs(log_dir, exist_ok=True)
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = _strftime("%Y%m%d_%H%M%S")
         input_name = os.path.splitext(os.path.basename(input_path))[0]
         self.log_path = os.path.join(log_dir, f"{input_name}_{timestamp}.log")
-        self.log_file = open(self.log_path, "a", encoding="utf-8")
+        # Lines are queued and written in batches by a background thread, one os.write each
+        self.log_file = LogWriter(self.log_path)
+        # Log timestamps only change once a second, so reuse (second, formatted) until then.
+        # Swapped as one tuple, so concurrent log() calls never see a mismatched pair
+        self._log_clock: tuple[int | None, str] = (None, "")
+        # Fixed annotations for blank and unparseable entries, built once and copied per use
+        self._blank_annotations = self._single_code_annotations("No Responses", "Blank", 1.0, self._model_name)
+        self._invalid_format_annotations = self._single_code_annotations("Error", "InvalidFormat", 0.0, self._model_name)
+        self._invalid_json_annotations = self._single_code_annotations("Error", "InvalidJSON", 0.0, self._model_name)
+        # (before, after) the response text; built once per load by _build_prompt
+        self._prompt_parts: tuple[str, str] | None = None
+        # Short hash of the prompt parts, so cached annotations are tied to the prompt that made them
+        self._prompt_sig: str | None = None
+        # (prompt_sig, normalized text) -> (text, annotations), for texts this pipeline has already annotated
+        self._annotation_cache: OrderedDict[tuple[str, str], tuple[str, dict]] = OrderedDict()
+        self._annotation_cache_lock = threading.Lock()
 
     def __str__(self):
         return "SimplePromptPipeline"
 
+    @property
+    def codebook(self) -> dict | None:
+        return self._codebook
+
+    @codebook.setter
+    def codebook(self, codebook: dict | None):
+        """Assigning a new codebook drops the serialized prompt parts built from the old one."""
+        self._codebook = codebook
+        self._prompt_parts = None
+
     def log(self, message: str):
-        ts = datetime.now().strftime("%H:%M:%S")
+        now = int(_time())
+        second, ts = self._log_clock
+        if now != second:
+            ts = _strftime("%H:%M:%S", _localtime(now))
+            self._log_clock = (now, ts)
         self.log_file.write(f"[{ts}] {message}\n")
+
+    def flush_log(self):
         self.log_file.flush()
 
+    @staticmethod
+    def _compact_json(obj) -> str:
+        """JSON for embedding in prompts: no whitespace, so fewer tokens, which models read just as well."""
+        return orjson.dumps(obj).decode()
+
     def _format_codebook(self) -> dict:
         """
         Converts the new format {theme: {code: desc}} into
@@ -42,88 +104,274 @@ class SimplePromptPipeline(AbstractTAPipeline):
             formatted[theme] = list(codes.keys()) if isinstance(codes, dict) else codes
         return formatted
 
-    def annotate_entry(self, entry: dict) -> dict:
-        text = entry.get("text", "").strip()
+    def load_data(self):
+        super().load_data()
+        # The question may have changed too, so rebuild the prompt parts
+        self._prompt_parts = None
 
-        # 1. Handle blank text
-        if not text:
-            entry["annotations"] = {
-                "No Responses": {
-                    "Blank": {
-                        "section": "",
-                        "confidence": 1.0,
-                        "annotator": self.llm.model_name
-                    }
-                }
-            }
-            self.log(f"Entry {entry['id']}: Blank text — annotated with 'Blank' code.")
-            return entry
+    def _annotate_blank(self, entry: dict) -> dict:
+        entry["annotations"] = self._copy_annotations(self._blank_annotations)
+        self.log(f"Entry {entry['id']}: Blank text — annotated with 'Blank' code.")
+        return entry
 
-        # 2. Format codebook (ignore descriptions)
-        codebook_for_prompt = self._format_codebook()
+    def _build_prompt(self, text: str) -> str:
+        """
+        Wraps the JSON-encoded text in the prompt parts. Everything but the text is
+        the same for every entry, so the codebook is only formatted once per load.
+        The text is encoded as UTF-8 rather than \\u escapes, matching the codebook.
+        """
+        if self._prompt_parts is None:
+            self._prompt_parts = self._make_prompt_parts()
+        before, after = self._prompt_parts
+        # One join sizes and copies the prompt once; a + b + c builds an intermediate string
+        return "".join((before, orjson.dumps(text).decode(), after))
 
-        # 3. Construct prompt
-        prompt = f"""
-        You are a thematic annotator. Based on the following text and codebook, return only a JSON object in the specified format (no explanations).
-
-        Text: {json.dumps(text)}
-        Codebook: {json.dumps(codebook_for_prompt, indent=2)}
-
-        Output format:
-        {{
-          "annotations": {{
-            "theme_name": {{
-              "code_name": {{"section": "[start:end]", "confidence": float, "annotator": "{self.llm.model_name}"}}
-            }}
-          }}
-        }}
+    def _make_prompt_parts(self) -> tuple[str, str]:
+        """
+        Evaluates the prompt template once and splits it around TEXT_SLOT, so each
+        entry only costs two concatenations rather than a template render.
+        Templates put TEXT_SLOT after the instructions, codebook and output format,
+        so every prompt shares one long prefix that servers with prefix caching
+        (OpenAI, vLLM, Ollama) only have to prefill once.
+        """
+        template = self._make_prompt_template()
+        if template.count(self.TEXT_SLOT) != 1:
+            raise ValueError(f"Prompt template must contain {self.TEXT_SLOT} exactly once.")
+        before, _, after = template.partition(self.TEXT_SLOT)
+        self._prompt_sig = hashlib.blake2b(
+            f"{self._prompt_cache_model()}\0{before}\0{after}".encode("utf-8"), digest_size=8
+        ).hexdigest()
+        return before, after
+
+    def _checkpoint_signature(self) -> dict:
+        if self._prompt_parts is None:
+            self._prompt_parts = self._make_prompt_parts()
+        return dict(super()._checkpoint_signature(), prompt=self._prompt_sig)
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        """Lowercased, with runs of whitespace collapsed and trailing punctuation dropped."""
+        normalized = _WHITESPACE.sub(" ", text).strip().lower().rstrip(_TRAILING)
+        return normalized or text
+
+    def _annotation_cache_key(self, text: str) -> tuple[str, str]:
+        if self._prompt_parts is None:
+            self._prompt_parts = self._make_prompt_parts()
+        return self._prompt_sig, self._normalize(text)
+
+    @staticmethod
+    def _has_sections(annotations: dict) -> bool:
+        return any(details.get("section") for codes in annotations.values() for details in codes.values())
+
+    def _annotate_from_cache(self, entry: dict, text: str) -> bool:
         """
+        Copies the annotations of an equivalent text annotated earlier with the same
+        prompt onto entry. Much cheaper than the prompt cache: no prompt is built,
+        hashed or parsed. Texts only need to match after _normalize, unless the
+        annotations carry sections, whose character offsets need the exact text.
+        Returns False on a miss, or when use_cache is off.
+        """
+        if not self.use_cache:
+            return False
+        key = self._annotation_cache_key(text)
+        with self._annotation_cache_lock:
+            cached = self._annotation_cache.get(key)
+            if cached is None:
+                return False
+            cached_text, annotations = cached
+            if cached_text != text and self._has_sections(annotations):
+                return False
+            self._annotation_cache.move_to_end(key)
+        entry["annotations"] = self._copy_annotations(annotations)
+        self.log(f"Entry {entry['id']}: annotations reused from an equivalent text{self.log_tag}.")
+        return True
+
+    def _finish_entry(self, entry: dict, text: str, response: str) -> dict:
+        """_apply_response, remembering the annotations for text unless they are an error."""
+        self._apply_response(entry, response)
+        if self.use_cache and "Error" not in entry["annotations"]:
+            key = self._annotation_cache_key(text)
+            annotations = self._copy_annotations(entry["annotations"])
+            with self._annotation_cache_lock:
+                self._annotation_cache[key] = (text, annotations)
+                self._annotation_cache.move_to_end(key)
+                if len(self._annotation_cache) > self.ANNOTATION_CACHE_SIZE:
+                    self._annotation_cache.popitem(last=False)
+        return entry
+
+    def _make_prompt_template(self) -> str:
+        # Format codebook (ignore descriptions)
+        codebook_for_prompt = self._format_codebook()
+
+        return f"""
+You are a thematic annotator. Based on the following codebook and text, return only a JSON object in the specified format (no explanations).
 
-        # 4. Generate + parse JSON
-        response = self.llm.generate(prompt)
+Codebook: {self._compact_json(codebook_for_prompt)}
 
+Output format:
+{{
+  "annotations": {{
+    "theme_name": {{
+      "code_name": {{"section": "[start:end]", "confidence": float}}
+    }}
+  }}
+}}
+
+Text: {self.TEXT_SLOT}
+"""
+
+    def _apply_response(self, entry: dict, response: str) -> dict:
+        """Parses a raw LLM response and stores the validated annotations on the entry."""
         try:
             result = self.llm.clean_and_parse_json(response)
             annotation = result.get("annotations", {})
+            self._stamp_annotator(annotation, self._model_name)
 
             if self.validate_annotation_structure(annotation):
                 entry["annotations"] = annotation
-                self.log(f"Entry {entry['id']}: JSON processed successfully.")
+                self.log(f"Entry {entry['id']}: JSON processed successfully{self.log_tag}.")
             else:
-                self.log(f"Entry {entry['id']}: JSON produced but invalid format.")
+                self.log(f"Entry {entry['id']}: JSON produced but invalid format{self.log_tag}.")
                 self.log(f"Raw LLM output:\n{response}\n{'-'*60}")
-                entry["annotations"] = {
-                    "Error": {
-                        "InvalidFormat": {
-                            "section": "",
-                            "confidence": 0.0,
-                            "annotator": self.llm.model_name
-                        }
-                    }
-                }
+                entry["annotations"] = self._copy_annotations(self._invalid_format_annotations)
 
         except Exception as e:
-            self.log(f"Entry {entry['id']}: JSON parsing error: {e}")
+            self.log(f"Entry {entry['id']}: JSON parsing error{self.log_tag}: {e}")
             self.log(f"Raw LLM output:\n{response}\n{'-'*60}")
-            entry["annotations"] = {
-                "Error": {
-                    "InvalidJSON": {
-                        "section": "",
-                        "confidence": 0.0,
-                        "annotator": self.llm.model_name
-                    }
-                }
-            }
+            entry["annotations"] = self._copy_annotations(self._invalid_json_annotations)
 
         return entry
 
+    @staticmethod
+    def _stamp_annotator(annotation, annotator: str):
+        """
+        Sets the annotator on every parsed code. Prompts no longer ask the model to
+        echo it, which saves output tokens and keeps the field exact.
+        """
+        if not isinstance(annotation, dict):
+            return
+        for codes in annotation.values():
+            if isinstance(codes, dict):
+                for details in codes.values():
+                    if isinstance(details, dict):
+                        details["annotator"] = annotator
+
+    def _error_entry(self, entry: dict, error: Exception) -> dict:
+        self.log(f"Entry {entry['id']}: annotation failed{self.log_tag}: {error}")
+        # Failures are what the log gets read for, so get them on disk straight away
+        self.flush_log()
+        return super()._error_entry(entry, error)
+
+    def annotate_entry(self, entry: dict) -> dict:
+        text = entry.get("text", "")
+
+        # 1. Handle blank text
+        if self._is_blank(text):
+            return self._annotate_blank(entry)
+
+        text = text.strip()
+        if self._annotate_from_cache(entry, text):
+            return entry
+
+        # 2. Construct prompt
+        prompt = self._build_prompt(text)
+
+        # 3. Generate + parse JSON
+        response = self._generate(prompt)
+        return self._finish_entry(entry, text, response)
+
+    def _build_packed_prompt(self, entries: list[dict]) -> str:
+        """One prompt for several entries, so the shared prefix is only sent once."""
+        if self._prompt_parts is None:
+            self._prompt_parts = self._make_prompt_parts()
+        before, after = self._prompt_parts
+        items = [{"id": entry["id"], "text": entry["text"].strip()} for entry in entries]
+        return "".join((before, orjson.dumps(items).decode(), after, self.PACKED_INSTRUCTIONS))
+
+    def _annotate_packed(self, entries: list[dict]):
+        """
+        Annotates entries from a single packed prompt. Each entry's part of the reply
+        goes through _apply_response as if it had been asked on its own; entries the
+        reply leaves out, or all of them if it is not a JSON object, are re-asked singly.
+        """
+        response = self._generate(self._build_packed_prompt(entries))
+        try:
+            results = self.llm.clean_and_parse_json(response)
+            if not isinstance(results, dict):
+                raise ValueError("expected a JSON object keyed by id")
+        except Exception as e:
+            self.log(f"Packed prompt for {len(entries)} entries unusable{self.log_tag}: {e}; retrying singly.")
+            results = {}
+
+        for entry in entries:
+            result = results.get(str(entry["id"]))
+            if isinstance(result, dict):
+                self._finish_entry(entry, entry["text"].strip(), orjson.dumps(result).decode())
+            else:
+                self.annotate_entry(entry)
+
+    def annotate_batch(self, entries: list[dict]) -> list[dict]:
+        """
+        Sends the prompts for a whole chunk in one batched model call, or with
+        pack_batch, all of its entries in one prompt.
+        """
+        pending, prompts = [], []
+        for entry in entries:
+            text = entry.get("text", "")
+            if self._is_blank(text):
+                self._annotate_blank(entry)
+                continue
+            if self._annotate_from_cache(entry, text.strip()):
+                continue
+            pending.append(entry)
+            if not self.pack_batch:
+                prompts.append(self._build_prompt(text.strip()))
+
+        if self.pack_batch and len(pending) > 1:
+            self._annotate_packed(pending)
+        elif self.pack_batch and pending:
+            self.annotate_entry(pending[0])
+        elif prompts:
+            responses = self._generate_batch(prompts)
+            for entry, response in zip(pending, responses):
+                self._finish_entry(entry, entry["text"].strip(), response)
+
+        return entries
+
     def run(self) -> str:
-        self.log(f"=== Pipeline started for {self.input_path} using {self.llm.model_name} ===")
+        self.log(f"=== Pipeline started for {self.input_path} using {self._model_name} ===")
         try:
             output_path = super().run()
             self.log(f"Pipeline completed successfully. Output at {output_path}")
         except Exception as e:
             self.log(f"Pipeline failed: {e}")
+            self.flush_log()
+            raise
+        finally:
+            self.log_file.close()
+            print(f"Logs saved to {self.log_path}")
+        return output_path
+
+    async def annotate_entry_async(self, entry: dict) -> dict:
+        text = entry.get("text", "")
+        if self._is_blank(text):
+            return self._annotate_blank(entry)
+
+        text = text.strip()
+        if self._annotate_from_cache(entry, text):
+            return entry
+
+        response = await self._agenerate(self._build_prompt(text))
+        return self._finish_entry(entry, text, response)
+
+    async def arun(self) -> str:
+        self.log(f"=== Async pipeline started for {self.input_path} using {self._model_name} ===")
+        try:
+            output_path = await super().arun()
+            self.log(f"Pipeline completed successfully. Output at {output_path}")
+        except Exception as e:
+            self.log(f"Pipeline failed: {e}")
+            self.flush_log()
             raise
         finally:
             self.log_file.close()
@@ -136,6 +384,8 @@ class SimplePromptPipeline(AbstractTAPipeline):
 # ----------------------------------------------------------------------
 
 class SimplePromptDescPipeline(SimplePromptPipeline):
+    log_tag = " (desc mode)"
+
     def __str__(self):
         return "SimplePromptDescPipeline"
 
@@ -156,79 +406,28 @@ class SimplePromptDescPipeline(SimplePromptPipeline):
                 formatted[theme] = [{"code": c, "description": ""} for c in codes]
         return formatted
 
-    def annotate_entry(self, entry: dict) -> dict:
-        text = entry.get("text", "").strip()
-
-        if not text:
-            entry["annotations"] = {
-                "No Responses": {
-                    "Blank": {
-                        "section": "",
-                        "confidence": 1.0,
-                        "annotator": self.llm.model_name
-                    }
-                }
-            }
-            self.log(f"Entry {entry['id']}: Blank text — annotated with 'Blank' code.")
-            return entry
-
+    def _make_prompt_template(self) -> str:
         # Use descriptive codebook
         codebook_for_prompt = self._format_codebook()
 
-        prompt = f"""
-        You are a thematic annotator. Based on the following text and detailed codebook,
-        identify relevant themes and codes. Use descriptions to guide your judgment.
-        Return only a JSON object in the specified format (no explanations).
-
-        Text: {json.dumps(text)}
-        Codebook (with descriptions): {json.dumps(codebook_for_prompt, indent=2)}
-
-        Output format:
-        {{
-          "annotations": {{
-            "theme_name": {{
-              "code_name": {{"section": "[start:end]", "confidence": float, "annotator": "{self.llm.model_name}"}}
-            }}
-          }}
-        }}
-        """
+        return f"""
+You are a thematic annotator. Based on the following detailed codebook and text,
+identify relevant themes and codes. Use descriptions to guide your judgment.
+Return only a JSON object in the specified format (no explanations).
 
-        response = self.llm.generate(prompt)
+Codebook (with descriptions): {self._compact_json(codebook_for_prompt)}
 
-        try:
-            result = self.llm.clean_and_parse_json(response)
-            annotation = result.get("annotations", {})
+Output format:
+{{
+  "annotations": {{
+    "theme_name": {{
+      "code_name": {{"section": "[start:end]", "confidence": float}}
+    }}
+  }}
+}}
 
-            if self.validate_annotation_structure(annotation):
-                entry["annotations"] = annotation
-                self.log(f"Entry {entry['id']}: JSON processed successfully (desc mode).")
-            else:
-                self.log(f"Entry {entry['id']}: JSON produced but invalid format (desc mode).")
-                self.log(f"Raw LLM output:\n{response}\n{'-'*60}")
-                entry["annotations"] = {
-                    "Error": {
-                        "InvalidFormat": {
-                            "section": "",
-                            "confidence": 0.0,
-                            "annotator": self.llm.model_name
-                        }
-                    }
-                }
-
-        except Exception as e:
-            self.log(f"Entry {entry['id']}: JSON parsing error (desc mode): {e}")
-            self.log(f"Raw LLM output:\n{response}\n{'-'*60}")
-            entry["annotations"] = {
-                "Error": {
-                    "InvalidJSON": {
-                        "section": "",
-                        "confidence": 0.0,
-                        "annotator": self.llm.model_name
-                    }
-                }
-            }
-
-        return entry
+Text: {self.TEXT_SLOT}
+"""
 
 
 # ----------------------------------------------------------------------
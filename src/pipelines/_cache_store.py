@@ -0,0 +1,53 @@
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class Store:
+    """
+    Run cache mapping (input file, model, pipeline) to the output of the last
+    successful run, kept in SQLite so lookups and updates touch a single row.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "input_file TEXT NOT NULL, model TEXT NOT NULL, pipeline TEXT NOT NULL, "
+                "output_path TEXT NOT NULL, timestamp TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS cache_key ON cache (input_file, model, pipeline)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            # WAL keeps readers unblocked and survives crashes mid-write
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:  # commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, input_file: str, model: str, pipeline: str) -> dict | None:
+        """Returns {"output_path", "timestamp"} for the combination, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT output_path, timestamp FROM cache WHERE input_file = ? AND model = ? AND pipeline = ?",
+                (input_file, model, pipeline),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"output_path": row[0], "timestamp": row[1]}
+
+    def put(self, input_file: str, model: str, pipeline: str, output_path: str):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (input_file, model, pipeline, output_path, timestamp) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (input_file, model, pipeline, output_path, datetime.now().isoformat()),
+            )
@@ -0,0 +1,121 @@
+import os
+import queue
+import threading
+import weakref
+
+# Seconds between checks that the writer thread is still alive while waiting on it
+_POLL_INTERVAL = 1.0
+
+
+def _write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _drain(lines: queue.Queue, fd: int, max_write: int):
+    """
+    Writer thread: takes whatever has queued up (at most about max_write characters),
+    joins it and issues one os.write. None stops the thread; an Event is set once
+    everything queued before it is in the file.
+    """
+    while True:
+        item = lines.get()
+        batch, size, waiters, stop = [], 0, [], False
+        while True:
+            if item is None:
+                stop = True
+                break
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            else:
+                batch.append(item)
+                size += len(item)
+                if size >= max_write:
+                    break
+            try:
+                item = lines.get_nowait()
+            except queue.Empty:
+                break
+
+        try:
+            if batch:
+                # Lone surrogates (e.g. from undecodable input) are escaped rather than raising
+                _write_all(fd, "".join(batch).encode("utf-8", errors="backslashreplace"))
+        except Exception:
+            pass  # A failing log must not kill the writer and stall (or deadlock) the annotation run
+        finally:
+            for waiter in waiters:
+                waiter.set()
+        if stop:
+            return
+
+
+def _put(lines: queue.Queue, thread: threading.Thread, item) -> bool:
+    """Queues item, or returns False if the writer thread died while the queue was full."""
+    while True:
+        try:
+            lines.put(item, timeout=_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            if not thread.is_alive():
+                return False
+
+
+def _shutdown(lines: queue.Queue, thread: threading.Thread, fd: int):
+    _put(lines, thread, None)
+    thread.join()
+    os.close(fd)
+
+
+class LogWriter:
+    """
+    Append-only text log written by a background thread, with the file-like
+    write/flush/close subset the pipelines use. write() only queues the line, so
+    worker threads never wait on the disk; the writer batches queued lines into a
+    single os.write.
+    """
+    # Most characters joined into one os.write
+    MAX_WRITE = 128 * 1024
+    # Most lines waiting for the writer; beyond this write() blocks, so a stalled
+    # disk slows the run down instead of growing the queue without limit
+    MAX_QUEUED = 10_000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._lines = queue.Queue(maxsize=self.MAX_QUEUED)
+        self._closed = False
+        self._thread = threading.Thread(
+            target=_drain,
+            args=(self._lines, self._fd, self.MAX_WRITE),
+            name=f"log-writer-{os.path.basename(path)}",
+            daemon=True
+        )
+        self._thread.start()
+        # The thread is a daemon so it never blocks exit; this still drains it at exit
+        # (or when the writer is garbage collected) if close() was never called
+        self._finalizer = weakref.finalize(self, _shutdown, self._lines, self._thread, self._fd)
+
+    def write(self, text: str):
+        if self._closed:
+            raise ValueError("I/O operation on closed log.")
+        # If the writer thread is gone the line is dropped rather than blocking forever
+        _put(self._lines, self._thread, text)
+
+    def flush(self):
+        """Blocks until every line written so far is in the file, or the writer thread dies."""
+        if self._closed:
+            return
+        done = threading.Event()
+        if not _put(self._lines, self._thread, done):
+            return
+        while not done.wait(_POLL_INTERVAL):
+            if not self._thread.is_alive():
+                return
+
+    def close(self):
+        """Writes out the queued lines, stops the writer thread and closes the file."""
+        if not self._closed:
+            self._closed = True
+            self._finalizer()